@@ -0,0 +1,152 @@
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# aggregations of local values that can be requested and the time index they group by
+AGGREGATIONS = ["hour", "weekday", "month"]
+# default quantiles estimated for every group
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+# default number of values kept per group to estimate the quantiles
+SKETCH_SIZE = 1024
+
+
+# function to build the hourly time index (hour of day, weekday and month of every row) of a data file
+# the data files have no time column, so the time index is either read from time_index (a csv file with
+# one timestamp per row in the first column) or inferred from year, month and day of the file name
+# (see get_year_month_day), starting at time_start if given
+# week files (e.g. datetime_sensor_id_week-11-2018.csv) and files that span more than the year, month or day
+# of their name (e.g. datetime_sensor_id_1921.csv with the years 2019 to 2021) can not be inferred and need
+# time_index or time_start
+def build_time_index(n_rows, year, month, day, time_index=None, time_start=None, file=None):
+    if time_index is not None:
+        timestamps = pd.to_datetime(pd.read_csv(time_index).iloc[:, 0])
+        if len(timestamps) < n_rows:
+            raise ValueError(f"time index {time_index} has {len(timestamps)} rows, data has {n_rows}")
+        timestamps = timestamps[:n_rows]
+        return {"hour": timestamps.dt.hour.to_numpy(), "weekday": timestamps.dt.isoweekday().to_numpy(), "month": timestamps.dt.month.to_numpy()}
+
+    # get_year_month_day reads the week number of a week file as month
+    if time_start is None and file is not None and "week" in os.path.basename(file):
+        raise ValueError(f"can not infer the time index of week file {file}, give time_index or time_start")
+
+    weekday = None
+    # last day of the period in the file name, the data has to fit into it
+    end = None
+    if time_start is not None:
+        start = pd.Timestamp(time_start).date()
+    elif pd.isna(month):
+        # year file or weekday file (all days of the year that are this weekday)
+        start = datetime.date(int(year), 1, 1)
+        end = datetime.date(int(year), 12, 31)
+        if not pd.isna(day):
+            weekday = int(day)
+    elif pd.isna(day):
+        # month file
+        start = datetime.date(int(year), int(month), 1)
+        end = (start.replace(day=28) + datetime.timedelta(days=4)).replace(day=1) - datetime.timedelta(days=1)
+    else:
+        # day file
+        start = datetime.date(int(year), int(month), int(day))
+        end = start
+
+    # every day has 24 rows, the 29th of February was removed in all datasets
+    dates = []
+    date = start
+    while len(dates) * 24 < n_rows:
+        if end is not None and date > end:
+            raise ValueError(f"{n_rows} rows do not fit into the period {start} to {end} inferred from the name of {file}, give time_index or time_start")
+        if not (date.month == 2 and date.day == 29) and (weekday is None or date.isoweekday() == weekday):
+            dates.append(date)
+        date += datetime.timedelta(days=1)
+
+    rows = np.arange(n_rows)
+    days = [dates[i] for i in rows // 24]
+    return {"hour": rows % 24, "weekday": np.array([d.isoweekday() for d in days]), "month": np.array([d.month for d in days])}
+
+
+# function to get the data row of every local value
+# local values are aligned to the end of the data (or of every block of split_length rows if the
+# observations were split), the first rows are lost to the history embedding or time lag
+def local_rows(n_locals, n_rows, split_length=None):
+    if split_length is None:
+        if n_locals > n_rows:
+            raise ValueError(f"{n_locals} local values for {n_rows} rows")
+        return np.arange(n_rows - n_locals, n_rows)
+
+    blocks = [(i, min(i + split_length, n_rows)) for i in range(0, n_rows, split_length)]
+    dropped, remainder = divmod(n_rows - n_locals, len(blocks))
+    if remainder != 0 or dropped < 0:
+        raise ValueError(f"{n_locals} local values can not be aligned to {len(blocks)} blocks of {split_length} rows")
+    return np.concatenate([np.arange(start + dropped, stop) for start, stop in blocks])
+
+
+# class to aggregate local values of many sensor pairs by hour of day, weekday and month while they are computed
+# for every pair and group it keeps the running mean and variance and a bounded random sample of the values
+# (bottom-k sample on random priorities) to estimate quantiles, so the local values are never materialised
+class LocalsAggregator:
+
+    def __init__(self, columns, aggregations=AGGREGATIONS, quantiles=QUANTILES, sketch_size=SKETCH_SIZE, chunk_size=65536, seed=0):
+        for aggregation in aggregations:
+            if aggregation not in AGGREGATIONS:
+                raise ValueError(f"unknown aggregation '{aggregation}', choose from {', '.join(AGGREGATIONS)}")
+
+        self.columns = list(columns)
+        self.aggregations = list(aggregations)
+        self.quantiles = list(quantiles)
+        self.sketch_size = int(sketch_size)
+        self.chunk_size = int(chunk_size)
+        self.rng = np.random.default_rng(seed)
+        self.time_index = None
+        self.rows = []
+
+    # set the time index of the file the following local values belong to, see build_time_index
+    def set_time_index(self, time_index):
+        self.time_index = time_index
+
+    # aggregate the local values of one pair, row holds the values for self.columns
+    # values can be a Java array, a list or a numpy array and are only converted chunk by chunk
+    def add(self, values, row, split_length=None):
+        n_rows = len(self.time_index["hour"])
+        rows = local_rows(len(values), n_rows, split_length)
+
+        # state per (aggregation, group): count, mean, sum of squared deviations, sample values and priorities
+        state = {}
+        for i in range(0, len(values), self.chunk_size):
+            chunk = np.asarray(values[i:i+self.chunk_size], dtype=np.float64)
+            chunk_rows = rows[i:i+len(chunk)]
+
+            for aggregation in self.aggregations:
+                groups = self.time_index[aggregation][chunk_rows]
+                for group in np.unique(groups):
+                    group_values = chunk[groups == group]
+                    key = (aggregation, int(group))
+                    count, mean, m2, sample, priorities = state.get(key, (0, 0.0, 0.0, np.empty(0), np.empty(0)))
+
+                    # combine the mean and sum of squared deviations with the running ones (Chan et al.)
+                    n = len(group_values)
+                    group_mean = group_values.mean()
+                    delta = group_mean - mean
+                    mean += delta * n / (count + n)
+                    m2 += ((group_values - group_mean) ** 2).sum() + delta ** 2 * count * n / (count + n)
+                    count += n
+
+                    # keep the values with the smallest random priorities, a uniform sample of all values so far
+                    sample = np.concatenate([sample, group_values])
+                    priorities = np.concatenate([priorities, self.rng.random(n)])
+                    if len(sample) > self.sketch_size:
+                        keep = np.argpartition(priorities, self.sketch_size)[:self.sketch_size]
+                        sample, priorities = sample[keep], priorities[keep]
+
+                    state[key] = (count, mean, m2, sample, priorities)
+
+        # only the summary of every group is kept
+        for (aggregation, group), (count, mean, m2, sample, _) in sorted(state.items()):
+            self.rows.append(list(row) + [aggregation, group, count, mean, m2 / count] + list(np.quantile(sample, self.quantiles)))
+
+    # return the summaries of all pairs so far as pandas df
+    def to_frame(self):
+        quantile_columns = [f"Q{q * 100:g}" for q in self.quantiles]
+        return pd.DataFrame(self.rows, columns=self.columns + ["Aggregation", "Group", "Count", "Mean", "Var"] + quantile_columns)
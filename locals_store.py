@@ -0,0 +1,121 @@
+import csv
+import os
+
+import numpy as np
+
+
+# default number of local values converted and written at once
+CHUNK_SIZE = 65536
+# default memory budget in bytes for buffered local values
+MEMORY_BUDGET = 64 * 2**20
+
+# columns added to the index of every sensor pair
+INDEX_COLUMNS = ["Offset", "Length", "Start", "Mean", "Std", "Min", "Max"]
+
+
+# class to write local values of many sensor pairs to disk while they are computed
+# the local values of all pairs are appended to one binary file "<outfile_base>.bin",
+# "<outfile_base>_index.csv" has one row per pair with its offset, length, start row and summary statistics
+# start is the data row of the first local value (the rows before are lost to the history embedding or time lag),
+# with split observations every block of split_length rows starts at this row (see locals_aggregation.local_rows)
+class LocalsWriter:
+
+    def __init__(self, outfile_base, columns, chunk_size=CHUNK_SIZE, memory_budget=MEMORY_BUDGET, dtype="float32"):
+        self.dtype = np.dtype(dtype)
+        self.chunk_size = int(chunk_size)
+        self.memory_budget = int(memory_budget)
+
+        # one chunk as float64 (for the statistics) and in the output dtype has to fit in the budget
+        if self.chunk_size < 1 or self.chunk_size * (8 + self.dtype.itemsize) > self.memory_budget:
+            raise ValueError(f"chunk_size {self.chunk_size} does not fit into a memory budget of {self.memory_budget} bytes")
+
+        self.values_file = outfile_base + ".bin"
+        self.index_file = outfile_base + "_index.csv"
+        self.columns = list(columns)
+
+        self._values = open(self.values_file, 'wb')
+        self._index = open(self.index_file, 'w', newline='')
+        self._index_writer = csv.writer(self._index)
+        self._index_writer.writerow(self.columns + INDEX_COLUMNS)
+
+        self._buffer = []
+        self._buffered_bytes = 0
+        self._offset = 0
+
+    # write the local values of one pair, row holds the values for self.columns
+    # values can be a Java array, a list or a numpy array and are only converted chunk by chunk
+    # start is the data row of the first local value
+    def add(self, values, row, start=0):
+        offset = self._offset
+        count = 0
+        mean = 0.0
+        m2 = 0.0
+        minimum = np.inf
+        maximum = -np.inf
+
+        for i in range(0, len(values), self.chunk_size):
+            chunk = np.asarray(values[i:i+self.chunk_size], dtype=np.float64)
+            n = len(chunk)
+
+            # combine the mean and sum of squared deviations of the chunk with the running ones (Chan et al.)
+            chunk_mean = chunk.mean()
+            chunk_m2 = ((chunk - chunk_mean) ** 2).sum()
+            delta = chunk_mean - mean
+            mean += delta * n / (count + n)
+            m2 += chunk_m2 + delta ** 2 * count * n / (count + n)
+            count += n
+            minimum = min(minimum, chunk.min())
+            maximum = max(maximum, chunk.max())
+
+            self._append(chunk.astype(self.dtype))
+
+        std = np.sqrt(m2 / count) if count > 0 else np.nan
+        if count == 0:
+            mean, minimum, maximum = np.nan, np.nan, np.nan
+
+        self._index_writer.writerow(list(row) + [offset, count, start, mean, std, minimum, maximum])
+
+    # buffer a converted chunk and flush the buffer before it exceeds the memory budget
+    def _append(self, chunk):
+        if self._buffered_bytes + chunk.nbytes > self.memory_budget:
+            self.flush()
+        self._buffer.append(chunk)
+        self._buffered_bytes += chunk.nbytes
+        self._offset += len(chunk)
+
+    # write all buffered values to disk
+    def flush(self):
+        for chunk in self._buffer:
+            chunk.tofile(self._values)
+        self._buffer = []
+        self._buffered_bytes = 0
+        self._values.flush()
+        self._index.flush()
+
+    def close(self):
+        if self._values.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self._values.close()
+            self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# function to open locals written by a LocalsWriter, the values are memory mapped and not read into memory
+# returns the index as pandas df and the values, the locals of row i are values[Offset:Offset+Length]
+# and belong to the data rows from Start on
+def open_locals(outfile_base, dtype="float32"):
+    import pandas as pd
+
+    index = pd.read_csv(outfile_base + "_index.csv")
+    if os.path.getsize(outfile_base + ".bin") == 0:
+        return index, np.zeros(0, dtype=dtype)
+    values = np.memmap(outfile_base + ".bin", dtype=dtype, mode='r')
+    return index, values
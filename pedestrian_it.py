@@ -0,0 +1,209 @@
+import argparse
+import inspect
+import json
+import sys
+import time
+from os import path as osp
+
+# sensor_analysis only imports the heavy dependencies (jpype, numpy, pandas, ...) inside
+# its functions, so listing, validating and dry-running a config starts in milliseconds
+import sensor_analysis as sa
+
+
+# measures that can be used in a job and the function (plus the names of its input and output argument) that runs them
+MEASURES = {
+    "TE": (sa.transfer_entropy_calculation, "file_path", "outfile_name"),
+    "MI": (sa.mutal_information_calculation, "file_path", "outfile_name"),
+    "AIS": (sa.active_information_storage_calculation, "file_path", "outfile_name"),
+    "ACF": (sa.plot_acf_for_file, "file_path", None),
+    "SEARCH_TE": (sa.search_for_best_parameters, "file", "outfile_name"),
+    "SEARCH_AIS": (sa.search_for_best_parameters, "file", "outfile_name"),
+    "LOCALS": (sa.make_locals_useable, "locals_file", "output_file"),
+    "CUBE": (sa.results_to_cube, "results_file", "cube_dir"),
+}
+
+# keys of a job that are not passed on as keyword arguments
+JOB_KEYS = ["name", "measure", "input", "output", "enabled"]
+
+
+# function to read a config file (yaml or json) and return it as a dict
+def load_config(config_file):
+    with open(config_file, 'r') as f:
+        if config_file.endswith(".json"):
+            config = json.load(f)
+        else:
+            # PyYAML is only needed for yaml configs, its errors are reported like the other config errors
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError(f"{config_file}: reading a yaml config needs PyYAML (pip install pyyaml), or use a json config")
+            try:
+                config = yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                raise ValueError(f"{config_file}: {e}")
+
+    if not isinstance(config, dict) or not isinstance(config.get("jobs"), list):
+        raise ValueError(f"{config_file}: config needs a list of 'jobs'")
+
+    # every job inherits the keyword arguments in "defaults" that its function accepts
+    defaults = config.get("defaults") or {}
+    jobs = []
+    for i, job in enumerate(config["jobs"]):
+        if not isinstance(job, dict):
+            raise ValueError(f"{config_file}: job {i} is not a mapping")
+        job = dict(job)
+        job.setdefault("name", f"job_{i}")
+        job["measure"] = str(job.get("measure", "")).upper()
+        if job["measure"] in MEASURES:
+            parameters = inspect.signature(MEASURES[job["measure"]][0]).parameters
+            job = {**{k: v for k, v in defaults.items() if k in parameters}, **job}
+        jobs.append(job)
+    config["jobs"] = jobs
+
+    return config
+
+
+# function to split a job into the function to call and its arguments
+def job_call(job):
+    function, input_arg, output_arg = MEASURES[job["measure"]]
+
+    kwargs = {k: v for k, v in job.items() if k not in JOB_KEYS}
+    kwargs[input_arg] = job.get("input")
+    if output_arg is not None:
+        kwargs[output_arg] = job.get("output")
+    if job["measure"].startswith("SEARCH_"):
+        kwargs["measure"] = job["measure"].split("_")[1]
+
+    return function, kwargs
+
+
+# function to get the files a job writes, so later jobs (e.g. CUBE) can use them as input
+# with stat_signif the estimation functions write <output>_stat_sig.csv instead of <output>
+def job_outputs(job):
+    output = job.get("output")
+    if not output:
+        return set()
+    if job["measure"] in ["TE", "MI", "AIS"] and job.get("stat_signif") and not output.endswith("_stat_sig.csv"):
+        return {output.split(".")[0] + "_stat_sig.csv"}
+    return {output}
+
+
+# function to check a job and return a list of problems (empty if the job is fine)
+# produced are the outputs of earlier jobs, which may be used as input
+def validate_job(job, produced=()):
+    problems = []
+
+    if job["measure"] not in MEASURES:
+        return [f"unknown measure '{job['measure']}', choose from {', '.join(MEASURES)}"]
+
+    function, kwargs = job_call(job)
+    _, input_arg, output_arg = MEASURES[job["measure"]]
+
+    if not job.get("input"):
+        problems.append("no 'input' given")
+    elif not osp.exists(job["input"]) and job["input"] not in produced:
+        problems.append(f"input '{job['input']}' does not exist")
+    if output_arg is not None and not job.get("output"):
+        problems.append("no 'output' given")
+
+    # check that all remaining keys are arguments of the function
+    parameters = inspect.signature(function).parameters
+    for key in kwargs:
+        if key not in parameters:
+            problems.append(f"unknown option '{key}' for {function.__name__}")
+
+    return problems
+
+
+# function to print the jobs of a config
+def list_jobs(config):
+    for job in config["jobs"]:
+        enabled = "" if job.get("enabled", True) else " (disabled)"
+        output = f" -> {job['output']}" if job.get("output") else ""
+        print(f"{job['name']}: {job['measure']} {job.get('input')}{output}{enabled}")
+
+
+# function to get the jobs to run: the ones named in only if given (also disabled ones), otherwise the enabled jobs
+def select_jobs(config, only=None):
+    if only:
+        unknown = [name for name in only if name not in [job["name"] for job in config["jobs"]]]
+        if unknown:
+            raise ValueError(f"no job named {', '.join(unknown)}")
+        return [job for job in config["jobs"] if job["name"] in only]
+    return [job for job in config["jobs"] if job.get("enabled", True)]
+
+
+# function to validate jobs, returns True if all jobs are fine
+def validate_jobs(jobs):
+    ok = True
+    produced = set()
+    for job in jobs:
+        for problem in validate_job(job, produced):
+            print(f"{job['name']}: {problem}")
+            ok = False
+        produced |= job_outputs(job)
+    return ok
+
+
+# function to run jobs of a config
+def run_jobs(config, jobs, dry_run=False):
+    jidt = config.get("jidt") or {}
+    sa.configure_jidt(jar=jidt.get("jar"), demos=jidt.get("demos"))
+
+    for job in jobs:
+        function, kwargs = job_call(job)
+        arguments = ", ".join(f"{k}={v!r}" for k, v in kwargs.items())
+        print(f"{job['name']}: {function.__name__}({arguments})")
+        if dry_run:
+            continue
+
+        start = time.time()
+        # the JVM is started by the estimation functions themselves on first use
+        function(**kwargs)
+        print(f"{job['name']}: done in {time.time() - start:.1f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pedestrian-it", description="Run batches of TE/MI/AIS jobs described in a config file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for command, help_text in [("list", "list the jobs of a config"), ("validate", "check a config without running it"), ("run", "run the jobs of a config")]:
+        subparser = subparsers.add_parser(command, help=help_text)
+        subparser.add_argument("config", help="yaml or json config file")
+        if command == "run":
+            subparser.add_argument("--dry-run", action="store_true", help="only print the calls that would be made")
+            subparser.add_argument("--only", action="append", metavar="NAME", help="name of a job to run (also if it is disabled), can be given several times")
+
+    args = parser.parse_args(argv)
+
+    try:
+        config = load_config(args.config)
+        # only the selected jobs are validated and run
+        jobs = select_jobs(config, getattr(args, "only", None))
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    if args.command == "list":
+        list_jobs(config)
+        return 0
+
+    ok = validate_jobs(jobs)
+    if args.command == "validate":
+        if ok:
+            print(f"{len(jobs)} enabled jobs ok")
+        return 0 if ok else 1
+
+    # a dry run shows the calls even if inputs are still missing
+    if args.dry_run:
+        run_jobs(config, jobs, dry_run=True)
+        return 0 if ok else 1
+
+    if not ok:
+        return 1
+    run_jobs(config, jobs)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+import queue
+import threading
+
+
+# marks the end of the items in a queue
+_DONE = object()
+
+
+# generator that loads the next items in a background thread while the current one is processed
+# yields (item, load(item)) in order, at most depth loaded items wait in the queue (depth=0 loads synchronously)
+# an exception in load is raised in the consumer when the item is reached
+def prefetch(items, load, depth=2):
+    if depth < 1:
+        for item in items:
+            yield item, load(item)
+        return
+
+    loaded = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def worker():
+        for item in items:
+            if stop.is_set():
+                return
+            try:
+                result = (item, load(item), None)
+            except Exception as e:
+                result = (item, None, e)
+            loaded.put(result)
+            if result[2] is not None:
+                return
+        loaded.put(_DONE)
+
+    thread = threading.Thread(target=worker, name="prefetch", daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            result = loaded.get()
+            if result is _DONE:
+                return
+            item, value, error = result
+            if error is not None:
+                raise error
+            yield item, value
+    finally:
+        # let the worker finish if the consumer stops early
+        stop.set()
+        while thread.is_alive():
+            try:
+                loaded.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+# class to run output writes (e.g. df.to_csv) in a background thread, off the critical path of the estimation
+# writes are run in the order they were submitted, at most max_pending writes wait in the queue (max_pending=0 writes synchronously)
+# the data passed to submit must not be changed afterwards (the result dfs are replaced by pd.concat, not changed)
+class BackgroundWriter:
+
+    def __init__(self, max_pending=2):
+        self._error = None
+        self._thread = None
+        if max_pending >= 1:
+            self._queue = queue.Queue(maxsize=max_pending)
+            self._thread = threading.Thread(target=self._run, name="writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is _DONE:
+                return
+            function, args, kwargs = task
+            if self._error is not None:
+                continue
+            try:
+                function(*args, **kwargs)
+            except Exception as e:
+                self._error = e
+
+    # queue function(*args, **kwargs), raises the error of an earlier failed write
+    def submit(self, function, *args, **kwargs):
+        self._raise()
+        if self._thread is None:
+            function(*args, **kwargs)
+        else:
+            self._queue.put((function, args, kwargs))
+
+    # wait for all queued writes and stop the thread
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_DONE)
+            self._thread.join()
+        self._raise()
+
+    def _raise(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,153 @@
+import json
+import os
+from os import path as osp
+
+import numpy as np
+import pandas as pd
+
+
+# class to keep TE/MI results as a dense cube with the p-values alongside
+# the arrays are stored as period x lag x source x destination, so the matrix of one period and lag is one
+# contiguous block and a memory mapped query only reads the pages of the slice it needs
+# periods are (Year, Month, Day) labels as in the result csvs, sensors are the sensor ids as strings
+# saved as .npy files plus a json file with the labels, so a saved cube can be memory mapped
+class ResultCube:
+
+    def __init__(self, measure, periods, sensors, lags, values, p_values):
+        self.measure = measure
+        self.periods = [tuple(period) for period in periods]
+        self.sensors = list(sensors)
+        self.lags = list(lags)
+        self.values = values
+        self.p_values = p_values
+
+    # build a cube from a long format results df with columns Year, Month, Day, Sensor1, Sensor2, Time_lag, <measure>, Stat_sig
+    @classmethod
+    def from_frame(cls, df, measure=None):
+        if measure is None:
+            measure = "TE" if "TE" in df.columns else "MI"
+        p_column = "Stat_sig" if "Stat_sig" in df.columns else "Stat_Sig"
+
+        periods = df[["Year", "Month", "Day"]].astype(object).fillna("nan").astype(str)
+        period_keys = periods["Year"] + "-" + periods["Month"] + "-" + periods["Day"]
+        sources = df["Sensor1"].astype(str)
+        destinations = df["Sensor2"].astype(str)
+        lags = df["Time_lag"].astype(int)
+
+        # keep the order of the periods, sensors sorted by their id
+        period_labels = list(dict.fromkeys(zip(periods["Year"], periods["Month"], periods["Day"])))
+        sensor_labels = sorted(set(sources) | set(destinations), key=lambda x: (len(x), x))
+        lag_labels = sorted(set(lags))
+
+        p = pd.Index(["-".join(period) for period in period_labels]).get_indexer(period_keys)
+        s = pd.Index(sensor_labels).get_indexer(sources)
+        d = pd.Index(sensor_labels).get_indexer(destinations)
+        l = pd.Index(lag_labels).get_indexer(lags)
+
+        shape = (len(period_labels), len(lag_labels), len(sensor_labels), len(sensor_labels))
+        values = np.full(shape, np.nan, dtype=np.float32)
+        p_values = np.full(shape, np.nan, dtype=np.float32)
+        values[p, l, s, d] = pd.to_numeric(df[measure], errors="coerce").to_numpy()
+        p_values[p, l, s, d] = pd.to_numeric(df[p_column], errors="coerce").to_numpy()
+
+        return cls(measure, period_labels, sensor_labels, lag_labels, values, p_values)
+
+    # build a cube from a results csv written by transfer_entropy_calculation or mutal_information_calculation
+    @classmethod
+    def from_csv(cls, file, measure=None):
+        return cls.from_frame(pd.read_csv(file, dtype={"Year": str, "Month": str, "Day": str, "Sensor1": str, "Sensor2": str}), measure)
+
+    # save the cube to a directory (values.npy, p_values.npy and labels.json)
+    # every file is written to a temporary file first and then renamed, so a reader never maps a half written file
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name, array in [("values.npy", self.values), ("p_values.npy", self.p_values)]:
+            with open(osp.join(directory, name + ".tmp"), 'wb') as f:
+                np.save(f, array)
+            os.replace(osp.join(directory, name + ".tmp"), osp.join(directory, name))
+        with open(osp.join(directory, "labels.json.tmp"), 'w') as f:
+            json.dump({"measure": self.measure, "axes": ["period", "lag", "source", "destination"], "periods": self.periods, "sensors": self.sensors, "lags": self.lags}, f)
+        os.replace(osp.join(directory, "labels.json.tmp"), osp.join(directory, "labels.json"))
+
+    # load a saved cube, by default the values are memory mapped and only the slices used are read
+    @classmethod
+    def load(cls, directory, mmap=True):
+        mmap_mode = 'r' if mmap else None
+        with open(osp.join(directory, "labels.json"), 'r') as f:
+            labels = json.load(f)
+        values = np.load(osp.join(directory, "values.npy"), mmap_mode=mmap_mode)
+        p_values = np.load(osp.join(directory, "p_values.npy"), mmap_mode=mmap_mode)
+        return cls(labels["measure"], labels["periods"], labels["sensors"], labels["lags"], values, p_values)
+
+    # period can be given as index or as (Year, Month, Day) label
+    def _period(self, period):
+        if isinstance(period, (tuple, list)):
+            return self.periods.index(tuple(str(x) for x in period))
+        return period
+
+    def _lag(self, lag):
+        if lag not in self.lags:
+            raise ValueError(f"lag {lag} not in cube, lags are {self.lags}")
+        return self.lags.index(lag)
+
+    # source x destination matrix of one lag as pandas df (rows are sources, columns destinations)
+    def lag_matrix(self, lag, period=0, p_values=False):
+        cube = self.p_values if p_values else self.values
+        matrix = np.asarray(cube[self._period(period), self._lag(lag)])
+        return pd.DataFrame(matrix, index=self.sensors, columns=self.sensors)
+
+    # the k pairs with the highest values, over all lags or for one lag
+    # symmetric=True only keeps one of the two directions (e.g. for MI at lag 0)
+    def top_k(self, k=10, lag=None, period=0, symmetric=False):
+        period = self._period(period)
+        if lag is None:
+            values = np.asarray(self.values[period])
+            p_values = np.asarray(self.p_values[period])
+            lags = self.lags
+        else:
+            values = np.asarray(self.values[period, self._lag(lag)])[None]
+            p_values = np.asarray(self.p_values[period, self._lag(lag)])[None]
+            lags = [lag]
+
+        ranking = np.where(np.isnan(values), -np.inf, values)
+        if symmetric:
+            lower = np.tril_indices(len(self.sensors))
+            ranking[:, lower[0], lower[1]] = -np.inf
+
+        flat = ranking.ravel()
+        k = min(k, int(np.isfinite(flat).sum()))
+        top = np.argpartition(-flat, k - 1)[:k] if k > 0 else np.array([], dtype=int)
+        top = top[np.argsort(-flat[top], kind="stable")]
+        l, s, d = np.unravel_index(top, ranking.shape)
+
+        return pd.DataFrame({
+            "Sensor1": [self.sensors[i] for i in s],
+            "Sensor2": [self.sensors[i] for i in d],
+            "Time_lag": [lags[i] for i in l],
+            self.measure: values[l, s, d],
+            "Stat_sig": p_values[l, s, d],
+        })
+
+    # sum of the values of every sensor as source ("out") or destination ("in") for one lag
+    def strength(self, lag, period=0, direction="out"):
+        matrix = np.asarray(self.values[self._period(period), self._lag(lag)])
+        if direction == "out":
+            strength = np.nansum(matrix, axis=1)
+        elif direction == "in":
+            strength = np.nansum(matrix, axis=0)
+        else:
+            raise ValueError(f"direction has to be 'in' or 'out', not '{direction}'")
+        return pd.Series(strength, index=self.sensors, name=f"{self.measure}_{direction}")
+
+    # save the matrix of one lag as csv
+    def to_csv(self, file, lag, period=0, sep=";"):
+        self.lag_matrix(lag, period).to_csv(file, sep=sep)
+
+    # return the top k pairs as latex table rows (same layout as csv_to_latex_table in prepare_jidt_data.py)
+    def to_latex(self, k=10, lag=None, period=0, symmetric=False, decimals=3):
+        top = self.top_k(k, lag, period, symmetric)
+        table = f"{' & '.join(top.columns)} \\\\ \\hline \n"
+        for row in top.itertuples(index=False):
+            columns = [str(x) if not isinstance(x, (float, np.floating)) else f"{x:.{decimals}f}" for x in row]
+            table += f"{' & '.join(columns)} \\\\ \\hline \n"
+        return table
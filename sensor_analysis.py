@@ -1,20 +1,86 @@
-from jpype import *
-import numpy as np
 import sys
-# Our python data file readers are a bit of a hack, python users will do better on this:
-sys.path.append("/Users/simongimmini/forks/jidt/demos/python")
-import readFloatsFile
-from pprint import pprint
-import pandas as pd
 import re
 import os
-from os import path as osp, stat
-from tqdm import tqdm
-import matplotlib.pyplot as plt
-from statsmodels.graphics.tsaplots import plot_acf
+from os import path as osp
+
+# Heavy dependencies (jpype, numpy, pandas, tqdm, matplotlib, statsmodels) are imported
+# inside the functions that need them, so that importing this module (e.g. from the
+# pedestrian_it CLI to list or validate jobs) stays fast.
+
+# location of the JIDT jar and of the JIDT python demos (for readFloatsFile),
+# can be overwritten with environment variables or via configure_jidt()
+JIDT_JAR = os.environ.get("JIDT_JAR", "/Users/simongimmini/forks/jidt/infodynamics.jar")
+JIDT_DEMOS = os.environ.get("JIDT_DEMOS", "/Users/simongimmini/forks/jidt/demos/python")
+
+
+# function to set the JIDT locations before the JVM is started
+def configure_jidt(jar=None, demos=None):
+    global JIDT_JAR, JIDT_DEMOS
+    if jar is not None:
+        JIDT_JAR = jar
+    if demos is not None:
+        JIDT_DEMOS = demos
+
+
+# function to start the JVM once, only when the first estimation begins
+def start_jvm(jar_location=None):
+    import jpype
+
+    if jpype.isJVMStarted():
+        return
+    if jar_location is None:
+        jar_location = JIDT_JAR
+    # Start the JVM (add the "-Xmx" option with say 1024M if you get crashes due to not enough memory space)
+    jpype.startJVM(jpype.getDefaultJVMPath(), "-ea", "-Djava.class.path=" + jar_location)
+
+
+# function to read a data file with the JIDT python reader
+def read_floats_file(file):
+    # Our python data file readers are a bit of a hack, python users will do better on this:
+    if JIDT_DEMOS not in sys.path:
+        sys.path.append(JIDT_DEMOS)
+    import readFloatsFile
+
+    return readFloatsFile.readFloatsFile(file)
+
+
+# function to load a data file: year, month and day from the file name, the column names (sensor ids),
+# the data as numpy array, every column as Java array (for setObservations) and, if split_length is given,
+# every column split into blocks of split_length rows as Java arrays (for addObservations)
+# with split_length the whole columns are only converted if keep_columns is set, otherwise columns is None
+def load_data_file(file, split_length=None, keep_columns=False):
+    import numpy as np
+    from jpype import JArray, JDouble
+
+    year, month, day = get_year_month_day(file)
+
+    # read first line of file to get column names
+    with open(file, 'r') as f:
+        column_names = f.readline().split(',')
+        # remove any non digit characters from column names
+        column_names = [re.sub(r'\D', '', column_name) for column_name in column_names]
+
+    # 0. Load/prepare the data as numpy array:
+    data = np.array(read_floats_file(file))
+
+    # convert every column once instead of for every pair and time lag
+    columns = None
+    if split_length is None or keep_columns:
+        columns = [JArray(JDouble, 1)(data[:, c].tolist()) for c in range(data.shape[1])]
+
+    blocks = None
+    if split_length is not None:
+        split_length = file_split_length(split_length, month)
+        blocks = [[JArray(JDouble, 1)(data[i:i+split_length, c].tolist()) for i in range(0, data.shape[0], split_length)] for c in range(data.shape[1])]
+
+    return year, month, day, column_names, data, columns, blocks
+
 
 # function to read in a file and make it useable for R
 def make_locals_useable(locals_file, output_file):
+    import pandas as pd
+    from tqdm import tqdm
+
 
     # output df where columns will be sensor pairs and rows values
     output_df = pd.DataFrame()
@@ -55,6 +121,10 @@ def make_locals_useable(locals_file, output_file):
 
 # plot autocorrelation function for one column of a file that is read in as a pandas df
 def plot_acf_for_file(file_path, lags=100):
+    import pandas as pd
+    import matplotlib.pyplot as plt
+    from statsmodels.graphics.tsaplots import plot_acf
+
     # print all column names
     df = pd.read_csv(file_path, sep=";")
     print(df.columns)
@@ -75,11 +145,11 @@ def get_year_month_day(file):
         try:
             # get month and year from file name in pattern mm-yyyy with regex
             month, year = re.findall(r'\d+', file.split("/")[-1])
-            day = np.nan
+            day = float("nan")
         except ValueError:
             # get year from file name in pattern yyyy with regex
             year = re.findall(r'\d+', file.split("/")[-1])[0]
-            month = np.nan
+            month = float("nan")
             # dict of weekday names to numbers 
             # this is for having a structure for a better analysis
             weekdays = {"monday": 1, "tuesday": 2, "wednesday": 3, "thursday": 4, "friday": 5, "saturday": 6, "sunday": 7}
@@ -90,7 +160,7 @@ def get_year_month_day(file):
                     day = weekdays[weekday]
                     break
                 else:
-                    day = np.nan
+                    day = float("nan")
 
     return year, month, day
 
@@ -109,8 +179,29 @@ def set_split_length(month):
 
     return split_length
 
+
+# function to get the split length of a file, a split_length of 31 splits by the number of days of the month of the file
+def file_split_length(split_length, month):
+    if split_length == 31:
+        return set_split_length(month=month)
+    return split_length
+
+# function to get the number of leading local TE values that JIDT pads with zeros after a single setObservations,
+# the time steps before startTimeForFirstDestEmbedding have no full source and destination history embedding yet
+def te_embedding_length(calc):
+    k, k_tau, l, l_tau, delay = [int(str(calc.getProperty(p))) for p in ["k_HISTORY", "k_TAU", "l_HISTORY", "l_TAU", "DELAY"]]
+    return max((k - 1) * k_tau, (l - 1) * l_tau + delay - 1) + 1
+
 # function to search for the best parameters for all columns and save them in a csv
 def search_for_best_parameters(file, outfile_name, measure):
+    import numpy as np
+    import pandas as pd
+    from tqdm import tqdm
+    from jpype import JPackage, JArray, JDouble
+
+    # start the JVM only now that an estimation begins
+    start_jvm()
+
     tqdm.write("Searching for best parameters for {}".format(file))    
 
     # pandas df to save the best parameters with column names for different parameters, depending on "measure"
@@ -127,7 +218,7 @@ def search_for_best_parameters(file, outfile_name, measure):
         # remove any non digit characters from column names
         column_names = [re.sub(r'\D', '', i) for i in column_names]
 
-    dataRaw = readFloatsFile.readFloatsFile(file)
+    dataRaw = read_floats_file(file)
 
     data = np.array(dataRaw)
     # 1. Construct the calculator:
@@ -196,7 +287,15 @@ def search_for_best_parameters(file, outfile_name, measure):
 
 
 # function to calculate the mutual information 
-def mutal_information_calculation(file_path, outfile_name, verbose=False, stat_signif=False, time_lag_max=10, dyn_corr_excl=0, split_observations=False, split_length=None, compute_locals=False):
+def mutal_information_calculation(file_path, outfile_name, verbose=False, stat_signif=False, time_lag_max=10, dyn_corr_excl=0, split_observations=False, split_length=None, compute_locals=False, locals_out_of_core=False, locals_chunk_size=65536, locals_memory_budget=64 * 2**20, locals_aggregations=None, time_index=None, time_start=None, cube_dir=None, prefetch_depth=2, background_writes=True):
+    import numpy as np
+    import pandas as pd
+    from tqdm import tqdm
+    from jpype import JPackage, JArray, JDouble
+    from prefetch import prefetch, BackgroundWriter
+
+    # start the JVM only now that an estimation begins
+    start_jvm()
 
     tqdm.write("Calculating mutual information")
     # array with all files in file_root with os.path
@@ -213,135 +312,171 @@ def mutal_information_calculation(file_path, outfile_name, verbose=False, stat_s
     df = pd.DataFrame(columns=["Year", "Month", "Day", "Sensor1", "Sensor2", "Time_lag", "MI", "Stat_Sig"])
 
     if compute_locals:
-        df_local = pd.DataFrame(columns=["Year", "Month", "Day", "Sensor1", "Sensor2", "Time_lag", "MI", "Stat_Sig", "Local_MI"])
+        if locals_out_of_core:
+            # write the local values of every pair to disk while they are computed, only summary statistics are kept in memory
+            from locals_store import LocalsWriter
+            locals_suffix = "_locals_stat_sig" if stat_signif else "_locals"
+            locals_writer = LocalsWriter(outfile_name.split(".")[0].replace("_stat_sig", "") + locals_suffix, columns=["Year", "Month", "Day", "Sensor1", "Sensor2", "Time_lag", "MI", "Stat_Sig"], chunk_size=locals_chunk_size, memory_budget=locals_memory_budget)
+        else:
+            df_local = pd.DataFrame(columns=["Year", "Month", "Day", "Sensor1", "Sensor2", "Time_lag", "MI", "Stat_Sig", "Local_MI"])
 
-    for file in tqdm(files, position=0, desc="Processing files"):
+    if locals_aggregations:
+        # aggregate the local values by hour of day, weekday and/or month while they are computed
+        from locals_aggregation import LocalsAggregator, build_time_index
+        locals_aggregator = LocalsAggregator(columns=["Year", "Month", "Day", "Sensor1", "Sensor2", "Time_lag", "MI", "Stat_Sig"], aggregations=locals_aggregations, chunk_size=locals_chunk_size)
+        outfile_name_summary = outfile_name.split(".")[0].replace("_stat_sig", "") + ("_locals_summary_stat_sig.csv" if stat_signif else "_locals_summary.csv")
 
-        #file_path = osp.join(file_root, file)
-        # print("----------------------------------")
-        tqdm.write("Processing file: \"" + file + "\"")
+    if cube_dir is not None:
+        # results are also saved as dense period x source x destination x lag cube for fast slicing
+        from result_cube import ResultCube
 
-        year, month, day = get_year_month_day(file)
+    # csvs are written in the background while the estimation goes on
+    writer = BackgroundWriter(max_pending=2 if background_writes else 0)
 
-        if verbose:
-            print("Year: " + str(year) + ", Month: " + str(month) + ", Day: " + str(day))
+    try:
+        # the next files are loaded (and converted to Java arrays) in the background while the current one is processed
+        for file, (year, month, day, column_names, data, columns, blocks) in tqdm(prefetch(files, lambda file: load_data_file(file, split_length if split_observations else None, keep_columns=True), depth=prefetch_depth), total=len(files), position=0, desc="Processing files"):
 
-        # read first line of file to get column names
-        with open(file, 'r') as f:
-            column_names = f.readline().split(',')
-            # remove any non digit characters from column names
-            column_names = [re.sub(r'\D', '', column_name) for column_name in column_names]
+            #file_path = osp.join(file_root, file)
+            # print("----------------------------------")
+            tqdm.write("Processing file: \"" + file + "\"")
 
-        # 0. Load/prepare the data:
-        dataRaw = readFloatsFile.readFloatsFile(file)
+            if verbose:
+                print("Year: " + str(year) + ", Month: " + str(month) + ", Day: " + str(day))
 
-        # print column names if verbose
-        if verbose:
-            print("Column names: " + str(column_names))
+            # print column names if verbose
+            if verbose:
+                print("Column names: " + str(column_names))
 
-        # As numpy array:
-        data = np.array(dataRaw)
-        # 1. Construct the calculator:
-        calcClass = JPackage("infodynamics.measures.continuous.kraskov").MutualInfoCalculatorMultiVariateKraskov1
-        calc = calcClass()
+            if locals_aggregations:
+                locals_aggregator.set_time_index(build_time_index(data.shape[0], year, month, day, time_index=time_index, time_start=time_start, file=file))
+            # 1. Construct the calculator:
+            calcClass = JPackage("infodynamics.measures.continuous.kraskov").MutualInfoCalculatorMultiVariateKraskov1
+            calc = calcClass()
 
-        if not split_observations:
-            calc.setProperty("DYN_CORR_EXCL", str(dyn_corr_excl))
+            if not split_observations:
+                calc.setProperty("DYN_CORR_EXCL", str(dyn_corr_excl))
 
-        for time_lag in tqdm(range(0, time_lag_max+1), position=1, leave=False, desc="Time lag"):
-            # 2. Set any properties to non-default values:
-            calc.setProperty("TIME_DIFF", str(time_lag))
-
-            # Compute for all pairs:
-            for s in tqdm(range(data.shape[1]), position=2, leave=False, desc="Sensor 1"):
-                for d in tqdm(range(data.shape[1]), position=3, leave=False, desc="Sensor 2"):
-                    # For each source-dest pair:
-                    if (s == d):
-                        continue
-
-                    # 3. Initialise the calculator for (re-)use:
-                    calc.initialise()
-
-                    if split_observations:
-                        if time_lag == 0:
-                            source = JArray(JDouble, 1)(data[:, s].tolist())
-                            destination = JArray(JDouble, 1)(data[:, d].tolist())
-                            calc.setObservations(source, destination)
-                        else:
-                            calc.startAddObservations()
+            for time_lag in tqdm(range(0, time_lag_max+1), position=1, leave=False, desc="Time lag"):
+                # 2. Set any properties to non-default values:
+                calc.setProperty("TIME_DIFF", str(time_lag))
 
-                            if split_length == 31:
-                                split_length = set_split_length(month=month)
+                # Compute for all pairs:
+                for s in tqdm(range(data.shape[1]), position=2, leave=False, desc="Sensor 1"):
+                    for d in tqdm(range(data.shape[1]), position=3, leave=False, desc="Sensor 2"):
+                        # For each source-dest pair:
+                        if (s == d):
+                            continue
 
-                            for i in range(0, data.shape[0], split_length):
-                                source = JArray(JDouble, 1)(data[i:i+split_length, s].tolist())
-                                destination = JArray(JDouble, 1)(data[i:i+split_length, d].tolist())
-                                calc.addObservations(source, destination)
+                        # 3. Initialise the calculator for (re-)use:
+                        calc.initialise()
 
-                            # 4. Finalise adding observations:
-                            calc.finaliseAddObservations()
+                        if split_observations:
+                            if time_lag == 0:
+                                source = columns[s]
+                                destination = columns[d]
+                                calc.setObservations(source, destination)
+                            else:
+                                calc.startAddObservations()
 
-                    else:
-                        source = JArray(JDouble, 1)(data[:, s].tolist())
-                        destination = JArray(JDouble, 1)(data[:, d].tolist())
-                        calc.setObservations(source, destination)
+                                for source, destination in zip(blocks[s], blocks[d]):
+                                    calc.addObservations(source, destination)
 
+                                # 4. Finalise adding observations:
+                                calc.finaliseAddObservations()
 
-                    # 4. Supply the sample data:
-                    calc.setObservations(source, destination)
+                        else:
+                            source = columns[s]
+                            destination = columns[d]
+                            calc.setObservations(source, destination)
 
-                    # 5. Compute the estimate:
-                    if compute_locals:
-                        locals = np.array(calc.computeLocalOfPreviousObservations())
-                        # convert locals to a string with 4 decimal places and each value seperated by a comma
-                        locals = ",".join([f"{local:.4f}" for local in locals])
-                    result = calc.computeAverageLocalOfObservations()
 
-                    if stat_signif:
-                        # 6. Compute the (statistical significance via) null distribution empirically (e.g. with 100 permutations):
-                        measDist = calc.computeSignificance(100)
-                        nulldist = measDist.getMeanOfDistribution()
-                        std = measDist.getStdOfDistribution()
-                        p_value = measDist.pValue
-                    else: 
-                        p_value = np.nan
-
-                    # save results in df with pd.concat
-                    df = pd.concat([df, pd.DataFrame([[year, month, day, column_names[s], column_names[d], time_lag, result, p_value]], columns=["Year", "Month", "Day", "Sensor1", "Sensor2", "Time_lag", "MI", "Stat_Sig"])], ignore_index=True)
-                    if compute_locals:
-                        df_local = pd.concat([df_local, pd.DataFrame([[year, month, day, column_names[s], column_names[d], time_lag, result, p_value, locals]], columns=["Year", "Month", "Day", "Sensor1", "Sensor2", "Time_lag", "MI", "Stat_Sig", "Local_MI"])], ignore_index=True)
- 
-                    # print result for each sensor pair with 4 decimal places, nulldist, std, p_value and time lag using f-string
-                    if verbose:
+                        # 4. Supply the sample data:
+                        calc.setObservations(source, destination)
+
+                        # 5. Compute the estimate:
+                        if compute_locals or locals_aggregations:
+                            locals = calc.computeLocalOfPreviousObservations()
+                        result = calc.computeAverageLocalOfObservations()
+
                         if stat_signif:
-                            tqdm.write(f"MI({column_names[s]} -> {column_names[d]}) = {result:.4f} nulldist = {nulldist:.4f} std = {std:.4f} p_value = {p_value:.4f} time lag = {time_lag}")
-                        else:
-                            print(f"MI_Kraskov for sensor {column_names[s]} to sensor {column_names[d]} = {result:.4f} nats, time lag: {time_lag}")
+                            # 6. Compute the (statistical significance via) null distribution empirically (e.g. with 100 permutations):
+                            measDist = calc.computeSignificance(100)
+                            nulldist = measDist.getMeanOfDistribution()
+                            std = measDist.getStdOfDistribution()
+                            p_value = measDist.pValue
+                        else: 
+                            p_value = np.nan
+
+                        # save results in df with pd.concat
+                        df = pd.concat([df, pd.DataFrame([[year, month, day, column_names[s], column_names[d], time_lag, result, p_value]], columns=["Year", "Month", "Day", "Sensor1", "Sensor2", "Time_lag", "MI", "Stat_Sig"])], ignore_index=True)
+                        if locals_aggregations:
+                            # the observations are always supplied with setObservations, so the locals are aligned to the end of the data
+                            locals_aggregator.add(locals, [year, month, day, column_names[s], column_names[d], time_lag, result, p_value])
+                        if compute_locals:
+                            if locals_out_of_core:
+                                # the Java array is converted and written chunk by chunk
+                                locals_writer.add(locals, [year, month, day, column_names[s], column_names[d], time_lag, result, p_value], start=data.shape[0] - len(locals))
+                            else:
+                                # convert locals to a string with 4 decimal places and each value seperated by a comma
+                                locals = ",".join([f"{local:.4f}" for local in np.array(locals)])
+                                df_local = pd.concat([df_local, pd.DataFrame([[year, month, day, column_names[s], column_names[d], time_lag, result, p_value, locals]], columns=["Year", "Month", "Day", "Sensor1", "Sensor2", "Time_lag", "MI", "Stat_Sig", "Local_MI"])], ignore_index=True)
+ 
+                        # print result for each sensor pair with 4 decimal places, nulldist, std, p_value and time lag using f-string
+                        if verbose:
+                            if stat_signif:
+                                tqdm.write(f"MI({column_names[s]} -> {column_names[d]}) = {result:.4f} nulldist = {nulldist:.4f} std = {std:.4f} p_value = {p_value:.4f} time lag = {time_lag}")
+                            else:
+                                print(f"MI_Kraskov for sensor {column_names[s]} to sensor {column_names[d]} = {result:.4f} nats, time lag: {time_lag}")
 
                     
-        # save df to csv
-        if stat_signif:
-            if outfile_name.endswith("_stat_sig.csv"):
-                df.to_csv(outfile_name, index=False)
-                if compute_locals:
-                    df_local.to_csv(outfile_name_locals, index=False)
-            else:
-                if compute_locals:
-                    outfile_name_locals = outfile_name.split(".")[0] + "_locals_stat_sig.csv"
-                    df_local.to_csv(outfile_name_locals, index=False)
-                outfile_name = outfile_name.split(".")[0] + "_stat_sig.csv"
-                df.to_csv(outfile_name, index=False)
+            # save df to csv
+            if stat_signif:
+                if outfile_name.endswith("_stat_sig.csv"):
+                    writer.submit(df.to_csv, outfile_name, index=False)
+                    if compute_locals and not locals_out_of_core:
+                        writer.submit(df_local.to_csv, outfile_name_locals, index=False)
+                else:
+                    if compute_locals and not locals_out_of_core:
+                        outfile_name_locals = outfile_name.split(".")[0] + "_locals_stat_sig.csv"
+                        writer.submit(df_local.to_csv, outfile_name_locals, index=False)
+                    outfile_name = outfile_name.split(".")[0] + "_stat_sig.csv"
+                    writer.submit(df.to_csv, outfile_name, index=False)
 
-        else:
-            if compute_locals:
-                outfile_name_locals = outfile_name.split(".")[0] + "_locals.csv"
-                df_local.to_csv(outfile_name_locals, index=False)
-            df.to_csv(outfile_name, index=False)
+            else:
+                if compute_locals and not locals_out_of_core:
+                    outfile_name_locals = outfile_name.split(".")[0] + "_locals.csv"
+                    writer.submit(df_local.to_csv, outfile_name_locals, index=False)
+                writer.submit(df.to_csv, outfile_name, index=False)
+
+            if compute_locals and locals_out_of_core:
+                locals_writer.flush()
+            if locals_aggregations:
+                writer.submit(locals_aggregator.to_frame().to_csv, outfile_name_summary, index=False)
+
+        # build the result cube once from the results of all files
+        if cube_dir is not None:
+            writer.submit(lambda df: ResultCube.from_frame(df, "MI").save(cube_dir), df)
+    finally:
+        # close the writers also if the estimation fails, so the results of the finished files and pairs are saved
+        try:
+            if compute_locals and locals_out_of_core:
+                locals_writer.close()
+        finally:
+            writer.close()
 
 
 
 # function to calculate the active information storage
-def active_information_storage_calculation(file_path, outfile_name, verbose=False, stat_signif=False, dyn_corr_excl=0, split_observations=False, split_length=None):
+def active_information_storage_calculation(file_path, outfile_name, verbose=False, stat_signif=False, dyn_corr_excl=0, split_observations=False, split_length=None, prefetch_depth=2, background_writes=True):
+    import numpy as np
+    import pandas as pd
+    from tqdm import tqdm
+    from jpype import JPackage, JArray, JDouble
+    from prefetch import prefetch, BackgroundWriter
+
+    # start the JVM only now that an estimation begins
+    start_jvm()
 
     tqdm.write("Calculating active information storage")
     # array with all files in file_root with os.path
@@ -357,106 +492,105 @@ def active_information_storage_calculation(file_path, outfile_name, verbose=Fals
     # pandas df with columns Year, Month, Day, Sensor, AIS and Stat_sig
     df = pd.DataFrame(columns=["Year", "Month", "Day", "Sensor", "AIS", "Stat_Sig"])
     
-    for file in tqdm(files, position=0, desc="Processing files"):
-    
-        tqdm.write("Processing file: \"" + file + "\"")
-    
-        year, month, day = get_year_month_day(file)
-
-        if verbose:
-            print("Year: " + str(year) + ", Month: " + str(month) + ", Day: " + str(day))
+    # csvs are written in the background while the estimation goes on
+    writer = BackgroundWriter(max_pending=2 if background_writes else 0)
 
-        # read first line of file to get column names
-        with open(file, 'r') as f:
-            column_names = f.readline().split(',')
-            # remove any non digit characters from column names
-            column_names = [re.sub(r'\D', '', column_name) for column_name in column_names]
+    try:
+        # the next files are loaded (and converted to Java arrays) in the background while the current one is processed
+        for file, (year, month, day, column_names, data, columns, blocks) in tqdm(prefetch(files, lambda file: load_data_file(file, split_length if split_observations else None), depth=prefetch_depth), total=len(files), position=0, desc="Processing files"):
     
-        # 0. Load/prepare the data:
-        dataRaw = readFloatsFile.readFloatsFile(file)
+            tqdm.write("Processing file: \"" + file + "\"")
     
-        # print column names if verbose
-        if verbose:
-            print("Column names: " + str(column_names))
+            if verbose:
+                print("Year: " + str(year) + ", Month: " + str(month) + ", Day: " + str(day))
+
+            # print column names if verbose
+            if verbose:
+                print("Column names: " + str(column_names))
     
-        # As numpy array:
-        data = np.array(dataRaw)
-        # 1. Construct the calculator:
-        calcClass = JPackage("infodynamics.measures.continuous.kraskov").ActiveInfoStorageCalculatorKraskov
-        calc = calcClass()
+            # 1. Construct the calculator:
+            calcClass = JPackage("infodynamics.measures.continuous.kraskov").ActiveInfoStorageCalculatorKraskov
+            calc = calcClass()
     
-        # 2. Set any properties to non-default values:
-        calc.setProperty("k_History", "2")
-        calc.setProperty("TAU", "5")
+            # 2. Set any properties to non-default values:
+            calc.setProperty("k_History", "2")
+            calc.setProperty("TAU", "5")
                 
-        # Compute for all columns:
-        for v in tqdm(range(data.shape[1]), position=2, leave=False, desc="Sensor 1"):
-
-            # set properties
-            # FIXME: Addition of multiple observation sets is not currently supported with property DYN_CORR_EXCL set
-            if not split_observations:
-                calc.setProperty("DYN_CORR_EXCL", str(dyn_corr_excl)) 
-                calc.setProperty("AUTO_EMBED_METHOD", "MAX_CORR_AIS")
-                calc.setProperty("AUTO_EMBED_K_SEARCH_MAX", "10")
-                calc.setProperty("AUTO_EMBED_TAU_SEARCH_MAX", "10")
+            # Compute for all columns:
+            for v in tqdm(range(data.shape[1]), position=2, leave=False, desc="Sensor 1"):
 
-            # 3. Initialise the calculator for (re-)use:
-            calc.initialise()
+                # set properties
+                # FIXME: Addition of multiple observation sets is not currently supported with property DYN_CORR_EXCL set
+                if not split_observations:
+                    calc.setProperty("DYN_CORR_EXCL", str(dyn_corr_excl)) 
+                    calc.setProperty("AUTO_EMBED_METHOD", "MAX_CORR_AIS")
+                    calc.setProperty("AUTO_EMBED_K_SEARCH_MAX", "10")
+                    calc.setProperty("AUTO_EMBED_TAU_SEARCH_MAX", "10")
 
-            if split_observations:
-                calc.startAddObservations()
+                # 3. Initialise the calculator for (re-)use:
+                calc.initialise()
 
-                if split_length == 31:
-                    split_length = set_split_length(month=month)                    
+                if split_observations:
+                    calc.startAddObservations()
 
-                # split every column to oberservations of length 24 for every day
-                for i in range(0, data.shape[0], split_length):
-                    observations = JArray(JDouble, 1)(data[i:i+split_length, v].tolist())
-                    calc.addObservations(observations)
+                    # every column is split to oberservations of length 24 for every day
+                    for observations in blocks[v]:
+                        calc.addObservations(observations)
 
-                # 4. Finalise adding observations:
-                calc.finaliseAddObservations()
+                    # 4. Finalise adding observations:
+                    calc.finaliseAddObservations()
 
-            else: 
-                variable = JArray(JDouble, 1)(data[:, v].tolist())
+                else: 
+                    variable = columns[v]
     
-                # 4. Supply the sample data:
-                calc.setObservations(variable)
+                    # 4. Supply the sample data:
+                    calc.setObservations(variable)
 
-            result = calc.computeAverageLocalOfObservations()
-            if stat_signif:
-                # 6. Compute the (statistical significance via) null distribution empirically (e.g. with 100 permutations):
-                measDist = calc.computeSignificance(100)
-                nulldist = measDist.getMeanOfDistribution()
-                std = measDist.getStdOfDistribution()
-                p_value = measDist.pValue
-            else: 
-                p_value = np.nan
-
-            # save results in df with pd.concat
-            df = pd.concat([df, pd.DataFrame([[year, month, day, column_names[v], result, p_value]], columns=["Year", "Month", "Day", "Sensor", "AIS", "Stat_Sig"])], ignore_index=True)
-
-            # print result for each sensor pair with 4 decimal places, nulldist, std, p_value and time lag using f-string
-            if verbose:
+                result = calc.computeAverageLocalOfObservations()
                 if stat_signif:
-                    tqdm.write(f"AIS({column_names[v]}) = {result:.4f} nulldist = {nulldist:.4f} std = {std:.4f} p_value = {p_value:.4f}")
-                else:
-                    print(f"AIS_Kraskov for sensor {column_names[v]} = {result:.4f} nats")
+                    # 6. Compute the (statistical significance via) null distribution empirically (e.g. with 100 permutations):
+                    measDist = calc.computeSignificance(100)
+                    nulldist = measDist.getMeanOfDistribution()
+                    std = measDist.getStdOfDistribution()
+                    p_value = measDist.pValue
+                else: 
+                    p_value = np.nan
+
+                # save results in df with pd.concat
+                df = pd.concat([df, pd.DataFrame([[year, month, day, column_names[v], result, p_value]], columns=["Year", "Month", "Day", "Sensor", "AIS", "Stat_Sig"])], ignore_index=True)
+
+                # print result for each sensor pair with 4 decimal places, nulldist, std, p_value and time lag using f-string
+                if verbose:
+                    if stat_signif:
+                        tqdm.write(f"AIS({column_names[v]}) = {result:.4f} nulldist = {nulldist:.4f} std = {std:.4f} p_value = {p_value:.4f}")
+                    else:
+                        print(f"AIS_Kraskov for sensor {column_names[v]} = {result:.4f} nats")
 
     
-        # save df to csv every file iteration
-        if stat_signif:
-            if outfile_name.endswith("_stat_sig.csv"):
-                df.to_csv(outfile_name, index=False)
+            # save df to csv every file iteration
+            if stat_signif:
+                if outfile_name.endswith("_stat_sig.csv"):
+                    writer.submit(df.to_csv, outfile_name, index=False)
+                else:
+                    outfile_name = outfile_name.split(".")[0] + "_stat_sig.csv"
+                    writer.submit(df.to_csv, outfile_name, index=False)
             else:
-                outfile_name = outfile_name.split(".")[0] + "_stat_sig.csv"
-                df.to_csv(outfile_name, index=False)
-        else:
-            df.to_csv(outfile_name, index=False)
+                writer.submit(df.to_csv, outfile_name, index=False)
+    finally:
+        # wait for the last writes, also if the estimation fails, so the results of the finished files are saved
+        writer.close()
 
 
 # function to calculate the transfer entropy for all sensor pairs
-def transfer_entropy_calculation(file_path, outfile_name, verbose=False, stat_signif=False, time_lag_max=10, dyn_corr_excl=0, split_observations=False, split_length=None, compute_locals=False):
+def transfer_entropy_calculation(file_path, outfile_name, verbose=False, stat_signif=False, time_lag_max=10, dyn_corr_excl=0, split_observations=False, split_length=None, compute_locals=False, locals_out_of_core=False, locals_chunk_size=65536, locals_memory_budget=64 * 2**20, locals_aggregations=None, time_index=None, time_start=None, cube_dir=None, prefetch_depth=2, background_writes=True):
+    import numpy as np
+    import pandas as pd
+    from tqdm import tqdm
+    from jpype import JPackage, JArray, JDouble
+    from prefetch import prefetch, BackgroundWriter
+
+    # start the JVM only now that an estimation begins
+    start_jvm()
 
     tqdm.write(f"Calculating transfer entropy for {file_path}")
     # array with all files in file_root with os.path
@@ -470,149 +604,186 @@ def transfer_entropy_calculation(file_path, outfile_name, verbose=False, stat_si
     df = pd.DataFrame(columns=["Year", "Month", "Day", "Sensor1", "Sensor2", "Time_lag", "TE", "Stat_sig"])
 
     if compute_locals:
-        # pandas df to save local values of transfer entropy with same columns as df and additional column Local_TE
-        df_local = pd.DataFrame(columns=["Year", "Month", "Day", "Sensor1", "Sensor2", "Time_lag", "TE", "Stat_sig", "Local_TE"])
+        if locals_out_of_core:
+            # write the local values of every pair to disk while they are computed, only summary statistics are kept in memory
+            from locals_store import LocalsWriter
+            locals_suffix = "_locals_stat_sig" if stat_signif else "_locals"
+            locals_writer = LocalsWriter(outfile_name.split(".")[0].replace("_stat_sig", "") + locals_suffix, columns=["Year", "Month", "Day", "Sensor1", "Sensor2", "Time_lag", "TE", "Stat_sig"], chunk_size=locals_chunk_size, memory_budget=locals_memory_budget)
+        else:
+            # pandas df to save local values of transfer entropy with same columns as df and additional column Local_TE
+            df_local = pd.DataFrame(columns=["Year", "Month", "Day", "Sensor1", "Sensor2", "Time_lag", "TE", "Stat_sig", "Local_TE"])
 
-    for file in tqdm(files, position=0, desc="Processing files"):
+    if locals_aggregations:
+        # aggregate the local values by hour of day, weekday and/or month while they are computed
+        from locals_aggregation import LocalsAggregator, build_time_index
+        locals_aggregator = LocalsAggregator(columns=["Year", "Month", "Day", "Sensor1", "Sensor2", "Time_lag", "TE", "Stat_sig"], aggregations=locals_aggregations, chunk_size=locals_chunk_size)
+        outfile_name_summary = outfile_name.split(".")[0].replace("_stat_sig", "") + ("_locals_summary_stat_sig.csv" if stat_signif else "_locals_summary.csv")
 
-        tqdm.write("Processing file: \"" + file + "\"")
+    if cube_dir is not None:
+        # results are also saved as dense period x source x destination x lag cube for fast slicing
+        from result_cube import ResultCube
 
-        year, month, day = get_year_month_day(file)
+    # csvs are written in the background while the estimation goes on
+    writer = BackgroundWriter(max_pending=2 if background_writes else 0)
 
-        # read first line of file to get column names
-        with open(file, 'r') as f:
-            column_names = f.readline().split(',')
-            # remove any non digit characters from column names
-            column_names = [re.sub(r'\D', '', column_name) for column_name in column_names]
+    try:
+        # the next files are loaded (and converted to Java arrays) in the background while the current one is processed
+        for file, (year, month, day, column_names, data, columns, blocks) in tqdm(prefetch(files, lambda file: load_data_file(file, split_length if split_observations else None), depth=prefetch_depth), total=len(files), position=0, desc="Processing files"):
 
-        # 0. Load/prepare the data:
-        dataRaw = readFloatsFile.readFloatsFile(file)
+            tqdm.write("Processing file: \"" + file + "\"")
 
-        # print column names if verbose
-        if verbose:
-            print("Column names: " + str(column_names))
+            # print column names if verbose
+            if verbose:
+                print("Column names: " + str(column_names))
 
-        # As numpy array:
-        data = np.array(dataRaw)
+            if locals_aggregations:
+                locals_aggregator.set_time_index(build_time_index(data.shape[0], year, month, day, time_index=time_index, time_start=time_start, file=file))
         
-        # 1. Construct the calculator:
-        calcClass = JPackage("infodynamics.measures.continuous.kraskov").TransferEntropyCalculatorKraskov
-        calc = calcClass()
-        # 2. Set any properties to non-default values:
-        calc.setProperty("k_HISTORY", "3")
-        calc.setProperty("k_TAU", "3")
-        calc.setProperty("l_HISTORY", "3")
-        calc.setProperty("l_TAU", "3")
-
-        if not split_observations:
-            calc.setProperty("DYN_CORR_EXCL", str(dyn_corr_excl))
-            # calc.setProperty("AUTO_EMBED_METHOD", "MAX_CORR_AIS")
-            # calc.setProperty("AUTO_EMBED_K_SEARCH_MAX", "10")
-            # calc.setProperty("AUTO_EMBED_TAU_SEARCH_MAX", "10")
-
-        for time_lag in tqdm(range(1, time_lag_max+1), position=1, leave=False, desc="Processing time lags"):
-            calc.setProperty("DELAY", str(time_lag))
-            # Compute for all pairs:
-            for d in tqdm(range(data.shape[1]), position=2, leave=False, desc="Processing targets"):
-                for s in tqdm(range(data.shape[1]), position=3, leave=False, desc="Processing sources"):
-                    # For each source-dest pair:
-                    if (s == d):
-                        continue
-
-                    # 3. Initialise the calculator for (re-)use:
-                    calc.initialise()
-
-                    if split_observations:
-                        calc.startAddObservations()
-
-                        if split_length == 31:
-                            split_length = set_split_length(month=month)                    
-
-                        # split every column to oberservations 
-                        for i in range(0, data.shape[0], split_length):
-                            source = JArray(JDouble, 1)(data[i:i+split_length, s].tolist())
-                            destination = JArray(JDouble, 1)(data[i:i+split_length, d].tolist())
-                            calc.addObservations(source, destination)
-
-                        # 4. Finalise adding observations:
-                        calc.finaliseAddObservations()
-                    
-                    else:
-                        source = JArray(JDouble, 1)(data[:, s].tolist())
-                        destination = JArray(JDouble, 1)(data[:, d].tolist())
-                        # 4. Supply the sample data:
-                        calc.setObservations(source, destination)
+            # 1. Construct the calculator:
+            calcClass = JPackage("infodynamics.measures.continuous.kraskov").TransferEntropyCalculatorKraskov
+            calc = calcClass()
+            # 2. Set any properties to non-default values:
+            calc.setProperty("k_HISTORY", "3")
+            calc.setProperty("k_TAU", "3")
+            calc.setProperty("l_HISTORY", "3")
+            calc.setProperty("l_TAU", "3")
 
-                    # 5. Compute the estimate:
-                    if compute_locals:
-                        locals = np.array(calc.computeLocalOfPreviousObservations())
-                        # convert locals to a string with 4 decimal places and each value seperated by a comma
-                        locals = ",".join([f"{local:.4f}" for local in locals])
-                    result = calc.computeAverageLocalOfObservations()
-
-                    # plot source and destination as time series and locals as x 
-                    # normalize source and destination
-                    # source = (source - np.mean(source)) / np.std(source)
-                    # destination = (destination - np.mean(destination)) / np.std(destination)
-                    # plt.plot(source)
-                    # plt.plot(destination)
-                    # # plot locals as x markers
-                    # plt.plot(locals, 'x')
-                    # plt.show()
-                    # print(locals)
-                    # print(type(locals))
-                    # exit()
+            if not split_observations:
+                calc.setProperty("DYN_CORR_EXCL", str(dyn_corr_excl))
+                # calc.setProperty("AUTO_EMBED_METHOD", "MAX_CORR_AIS")
+                # calc.setProperty("AUTO_EMBED_K_SEARCH_MAX", "10")
+                # calc.setProperty("AUTO_EMBED_TAU_SEARCH_MAX", "10")
+
+            for time_lag in tqdm(range(1, time_lag_max+1), position=1, leave=False, desc="Processing time lags"):
+                calc.setProperty("DELAY", str(time_lag))
+                # Compute for all pairs:
+                for d in tqdm(range(data.shape[1]), position=2, leave=False, desc="Processing targets"):
+                    for s in tqdm(range(data.shape[1]), position=3, leave=False, desc="Processing sources"):
+                        # For each source-dest pair:
+                        if (s == d):
+                            continue
+
+                        # 3. Initialise the calculator for (re-)use:
+                        calc.initialise()
+
+                        if split_observations:
+                            calc.startAddObservations()
 
-                    if stat_signif:
-                        # 6. Compute the (statistical significance via) null distribution empirically (e.g. with 100 permutations):
-                        measDist = calc.computeSignificance(100)
-                        nulldist = measDist.getMeanOfDistribution()
-                        std = measDist.getStdOfDistribution()
-                        p_value = measDist.pValue
-                    else:
-                        p_value = np.nan
+                            # every column is split to oberservations
+                            for source, destination in zip(blocks[s], blocks[d]):
+                                calc.addObservations(source, destination)
 
-                    # save results in df with pd.concat
-                    df = pd.concat([df, pd.DataFrame([[year, month, day, column_names[s], column_names[d], time_lag, result, p_value]], columns=["Year", "Month", "Day", "Sensor1", "Sensor2", "Time_lag", "TE", "Stat_sig"])], ignore_index=True)
-                    if compute_locals:
-                        df_local = pd.concat([df_local, pd.DataFrame([[year, month, day, column_names[s], column_names[d], time_lag, result, p_value, locals]], columns=["Year", "Month", "Day", "Sensor1", "Sensor2", "Time_lag", "TE", "Stat_sig", "Local_TE"])], ignore_index=True)
+                            # 4. Finalise adding observations:
+                            calc.finaliseAddObservations()
+                    
+                        else:
+                            source = columns[s]
+                            destination = columns[d]
+                            # 4. Supply the sample data:
+                            calc.setObservations(source, destination)
+
+                        # 5. Compute the estimate:
+                        if compute_locals or locals_aggregations:
+                            locals = calc.computeLocalOfPreviousObservations()
+                            # leave the zero padding of the first time steps out of the summaries (not needed with split observations)
+                            locals_embedded = locals if split_observations else locals[te_embedding_length(calc):]
+                        result = calc.computeAverageLocalOfObservations()
+
+                        # plot source and destination as time series and locals as x 
+                        # normalize source and destination
+                        # source = (source - np.mean(source)) / np.std(source)
+                        # destination = (destination - np.mean(destination)) / np.std(destination)
+                        # plt.plot(source)
+                        # plt.plot(destination)
+                        # # plot locals as x markers
+                        # plt.plot(locals, 'x')
+                        # plt.show()
+                        # print(locals)
+                        # print(type(locals))
+                        # exit()
 
-                    # print result for each sensor pair with 4 decimal places, null distribution, std, p-value and time lag using f-string
-                    if verbose:
                         if stat_signif:
-                            print(f"TE_Kraskov for sensor {column_names[s]} to sensor {column_names[d]} = {result:.4f} nats, null distribution: {nulldist}, std: {std}, p-value: {p_value}, time lag: {time_lag}")
+                            # 6. Compute the (statistical significance via) null distribution empirically (e.g. with 100 permutations):
+                            measDist = calc.computeSignificance(100)
+                            nulldist = measDist.getMeanOfDistribution()
+                            std = measDist.getStdOfDistribution()
+                            p_value = measDist.pValue
                         else:
-                            print(f"TE_Kraskov for sensor {column_names[s]} to sensor {column_names[d]} = {result:.4f} nats, time lag: {time_lag}")
+                            p_value = np.nan
+
+                        # save results in df with pd.concat
+                        df = pd.concat([df, pd.DataFrame([[year, month, day, column_names[s], column_names[d], time_lag, result, p_value]], columns=["Year", "Month", "Day", "Sensor1", "Sensor2", "Time_lag", "TE", "Stat_sig"])], ignore_index=True)
+                        if locals_aggregations:
+                            locals_aggregator.add(locals_embedded, [year, month, day, column_names[s], column_names[d], time_lag, result, p_value], split_length=file_split_length(split_length, month) if split_observations else None)
+                        if compute_locals:
+                            if locals_out_of_core:
+                                # the Java array is converted and written chunk by chunk
+                                locals_writer.add(locals_embedded, [year, month, day, column_names[s], column_names[d], time_lag, result, p_value], start=te_embedding_length(calc))
+                            else:
+                                # convert locals to a string with 4 decimal places and each value seperated by a comma
+                                locals = ",".join([f"{local:.4f}" for local in np.array(locals)])
+                                df_local = pd.concat([df_local, pd.DataFrame([[year, month, day, column_names[s], column_names[d], time_lag, result, p_value, locals]], columns=["Year", "Month", "Day", "Sensor1", "Sensor2", "Time_lag", "TE", "Stat_sig", "Local_TE"])], ignore_index=True)
+
+                        # print result for each sensor pair with 4 decimal places, null distribution, std, p-value and time lag using f-string
+                        if verbose:
+                            if stat_signif:
+                                print(f"TE_Kraskov for sensor {column_names[s]} to sensor {column_names[d]} = {result:.4f} nats, null distribution: {nulldist}, std: {std}, p-value: {p_value}, time lag: {time_lag}")
+                            else:
+                                print(f"TE_Kraskov for sensor {column_names[s]} to sensor {column_names[d]} = {result:.4f} nats, time lag: {time_lag}")
+
+                if stat_signif:
+                    if outfile_name.endswith("_stat_sig.csv"):
+                        writer.submit(df.to_csv, outfile_name, index=False)
+                        if compute_locals and not locals_out_of_core:
+                            writer.submit(df_local.to_csv, outfile_name_locals, index=False)
+                    else:
+                        if compute_locals and not locals_out_of_core:
+                            outfile_name_locals = outfile_name.split(".")[0] + "_locals_stat_sig.csv"
+                            writer.submit(df_local.to_csv, outfile_name_locals, index=False)
+                        outfile_name = outfile_name.split(".")[0] + "_stat_sig.csv"
+                        writer.submit(df.to_csv, outfile_name, index=False)
 
-            if stat_signif:
-                if outfile_name.endswith("_stat_sig.csv"):
-                    df.to_csv(outfile_name, index=False)
-                    if compute_locals:
-                        df_local.to_csv(outfile_name_locals, index=False)
                 else:
-                    if compute_locals:
-                        outfile_name_locals = outfile_name.split(".")[0] + "_locals_stat_sig.csv"
-                        df_local.to_csv(outfile_name_locals, index=False)
-                    outfile_name = outfile_name.split(".")[0] + "_stat_sig.csv"
-                    df.to_csv(outfile_name, index=False)
+                    if compute_locals and not locals_out_of_core:
+                        outfile_name_locals = outfile_name.split(".")[0] + "_locals.csv"
+                        writer.submit(df_local.to_csv, outfile_name_locals, index=False)
+                    writer.submit(df.to_csv, outfile_name, index=False)
+
+                if compute_locals and locals_out_of_core:
+                    locals_writer.flush()
+                if locals_aggregations:
+                    writer.submit(locals_aggregator.to_frame().to_csv, outfile_name_summary, index=False)
+
+        # build the result cube once from the results of all files
+        if cube_dir is not None:
+            writer.submit(lambda df: ResultCube.from_frame(df, "TE").save(cube_dir), df)
+    finally:
+        # close the writers also if the estimation fails, so the results of the finished files and pairs are saved
+        try:
+            if compute_locals and locals_out_of_core:
+                locals_writer.close()
+        finally:
+            writer.close()
 
-            else:
-                if compute_locals:
-                    outfile_name_locals = outfile_name.split(".")[0] + "_locals.csv"
-                    df_local.to_csv(outfile_name_locals, index=False)
-                df.to_csv(outfile_name, index=False)
+  
 
+# function to convert a TE or MI results csv to a result cube (see result_cube.py)
+def results_to_cube(results_file, cube_dir, measure=None):
+    from result_cube import ResultCube
+
+    cube = ResultCube.from_csv(results_file, measure)
+    cube.save(cube_dir)
+    print(f"Saved {cube.measure} cube with {len(cube.periods)} periods, {len(cube.sensors)} sensors and {len(cube.lags)} lags to {cube_dir}")
 
-  
 
 # main function
 def main():
 
-    # Add JIDT jar library to the path
-    jarLocation = "/Users/simongimmini/forks/jidt/infodynamics.jar"
+    # NOTE: batches of jobs can also be described in a config file and run with
+    # "python pedestrian_it.py run config.yaml", see pedestrian_it.yaml
 
-    # Start the JVM (add the "-Xmx" option with say 1024M if you get crashes due to not enough memory space)
-    startJVM(getDefaultJVMPath(), "-ea", "-Djava.class.path=" + jarLocation)
+    # Start the JVM with the JIDT jar (add the "-Xmx" option with say 1024M if you get crashes due to not enough memory space)
+    start_jvm()
 
     # DAY / WEEK
     # day_file = "data/one_week/datetime_sensor_id_week-11-2018.csv" 